@@ -1,16 +1,25 @@
-import os, uuid, logging, asyncio
-from typing import Optional, Dict, Set
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Body
+import os, time, logging, asyncio, threading, hashlib
+import orjson
+from typing import Optional, Dict, List
+from fastapi import FastAPI, HTTPException, WebSocket, Body, Header
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from sqlmodel import SQLModel, Field, Session, create_engine
-from contextlib import contextmanager
+from fastapi.responses import JSONResponse, Response
+from starlette.websockets import WebSocketState
+from sqlmodel import SQLModel, Field
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event, insert, update
+from sqlalchemy.ext.asyncio import create_async_engine
+from contextlib import asynccontextmanager
 
 # ——— Configuration ——————————————————
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("srv")
 
-app = FastAPI()
+class ORJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # CORS Middleware to allow cross-origin requests from the client
 app.add_middleware(
@@ -22,34 +31,104 @@ app.add_middleware(
 )
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./rps.db")
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+def async_database_url(url: str) -> str:
+    # Map plain driver URLs (as provided by Railway/Render) onto their async drivers
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
 
 # ——— Database Setup —————————————————
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+# Long-lived pooled connections keep SQLite's page cache warm between requests
+engine = create_async_engine(
+    async_database_url(DATABASE_URL),
+    connect_args={"check_same_thread": False} if IS_SQLITE else {},
+    pool_size=20,
+    max_overflow=10,
+    pool_timeout=30,
+    pool_pre_ping=True,
+    pool_recycle=3600,
 )
 
-@contextmanager
-def get_session():
-    with Session(engine) as session:
+if IS_SQLITE:
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.execute("PRAGMA cache_size=-65536")
+        cursor.close()
+        # The driver's implicit transactions never BEGIN before a SAVEPOINT, so a
+        # savepoint would open (and its RELEASE commit) the whole transaction.
+        # Hand transaction control to SQLAlchemy instead.
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def begin_sqlite_transaction(conn):
+        conn.exec_driver_sql("BEGIN")
+
+@asynccontextmanager
+async def get_session():
+    async with AsyncSession(engine, expire_on_commit=False) as session:
         try:
             yield session
-            session.commit()
+            await session.commit()
         except Exception as e:
-            session.rollback()
-            log.error(f"Database error: {str(e)}")
+            await session.rollback()
+            log.error("Database error: %s", e)
             raise
         finally:
-            session.close()
+            await session.close()
 
 @app.on_event("startup")
-def on_startup():
-    SQLModel.metadata.create_all(engine)
+async def on_startup():
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    # Fresh per lifespan: an asyncio.Queue binds to the loop that first uses it
+    app.state.write_queue = asyncio.Queue()
+    app.state.writes_closed = False
+    app.state.write_task = asyncio.create_task(write_matches(app.state.write_queue))
+    app.state.evict_task = asyncio.create_task(evict_idle_matches())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    app.state.evict_task.cancel()
+    # Let queued writes commit before the engine goes away
+    await close_writes()
+    if IS_SQLITE:
+        # Refresh planner statistics once per process instead of per request
+        async with engine.begin() as conn:
+            await conn.exec_driver_sql("PRAGMA optimize")
+    await engine.dispose()
+
+# ——— ID Generation ——————————————————
+# One os.urandom() call per thread refills entropy for 256 UUIDs
+_UUID_BATCH = 4096
+_uuid_local = threading.local()
+
+def fast_uuid_str() -> str:
+    offset = getattr(_uuid_local, "offset", _UUID_BATCH)
+    if offset >= _UUID_BATCH:
+        _uuid_local.raw = os.urandom(_UUID_BATCH)
+        offset = 0
+    _uuid_local.offset = offset + 16
+    b = bytearray(_uuid_local.raw[offset:offset + 16])
+    b[6] = (b[6] & 0x0F) | 0x40  # version 4
+    b[8] = (b[8] & 0x3F) | 0x80  # RFC 4122 variant
+    h = b.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
 
 # ——— Models —————————————————————————
 class Match(SQLModel, table=True):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
-    p1_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=fast_uuid_str, primary_key=True)
+    p1_id: str = Field(default_factory=fast_uuid_str)
     p1_name: str
     p1_ready: bool = False
     p2_id: Optional[str] = None
@@ -59,179 +138,435 @@ class Match(SQLModel, table=True):
     p2_move: Optional[str] = None
     is_active: bool = True
 
+# ——— Match Cache ————————————————————
+# Matches are tiny and short-lived, so reads are served from memory. Each write
+# touches exactly one game_id, which is updated in place after its commit.
+match_cache: Dict[str, Match] = {}
+# Last request or socket message per cached game, for idle eviction
+match_seen: Dict[str, float] = {}
+MATCH_IDLE_TTL = 600
+MATCH_SWEEP_INTERVAL = 60
+# Encoded state body, its ETag and the matching WebSocket event, rebuilt only
+# after the game changes and shared by /state, REST responses and broadcasts
+state_payloads: Dict[str, tuple] = {}
+
+class MatchLock:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+# Per-game write locks exist only while someone holds or waits on them
+match_locks: Dict[str, MatchLock] = {}
+
+@asynccontextmanager
+async def match_lock(game_id: str):
+    entry = match_locks.get(game_id)
+    if entry is None:
+        entry = match_locks[game_id] = MatchLock()
+    entry.users += 1
+    try:
+        async with entry.lock:
+            yield
+    finally:
+        entry.users -= 1
+        if not entry.users:
+            del match_locks[game_id]
+
+async def get_match(game_id: str) -> Optional[Match]:
+    game = match_cache.get(game_id)
+    if game is None:
+        async with get_session() as session:
+            game = await session.get(Match, game_id)
+        if game is None:
+            return None
+        # A concurrent miss may have cached its copy first; writes update
+        # that instance in place, so it must stay the only one
+        game = match_cache.setdefault(game_id, game)
+    match_seen[game_id] = time.monotonic()
+    return game
+
+def evict_match(game_id: str):
+    match_cache.pop(game_id, None)
+    match_seen.pop(game_id, None)
+    state_payloads.pop(game_id, None)
+
+async def evict_idle_matches():
+    # Games are never closed, so drop the ones nobody has touched in a while.
+    # Anything locked or with an open socket is still in use and stays.
+    while True:
+        await asyncio.sleep(MATCH_SWEEP_INTERVAL)
+        cutoff = time.monotonic() - MATCH_IDLE_TTL
+        for game_id, seen in list(match_seen.items()):
+            if (seen < cutoff and game_id not in match_locks
+                    and game_id not in manager.active_connections):
+                evict_match(game_id)
+
+async def update_match(game: Match, *conditions, **values) -> bool:
+    # Plain UPDATE of the changed columns; the row itself is never re-read.
+    # Extra conditions make the write conditional and atomic in the database.
+    values = {field: value for field, value in values.items() if getattr(game, field) != value}
+    if not values:
+        return True  # idempotent retry, nothing to write
+    rowcount = await queue_write(
+        update(Match).where(Match.id == game.id, *conditions).values(**values)
+    )
+    state_payloads.pop(game.id, None)
+    if rowcount == 0:
+        evict_match(game.id)
+        return False
+    for field, value in values.items():
+        setattr(game, field, value)
+    return True
+
+def state_payload(game: Match) -> tuple:
+    payload = state_payloads.get(game.id)
+    if payload is None:
+        body = orjson.dumps(game_state(game))
+        etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        event = {"type": "websocket.send", "text": body.decode()}
+        payload = state_payloads[game.id] = (body, etag, event)
+    return payload
+
+# ——— Batched Writes —————————————————
+# All writes are queued and executed by a single task. Whatever piles up while a
+# commit is in flight goes out in one transaction: new games as one multi-row
+# INSERT, updates as individual statements, then a single commit. Each statement
+# runs in its own savepoint so a failure only reaches the caller that sent it.
+WRITE_BATCH_SIZE = 64
+
+def queue_write(item):
+    if app.state.writes_closed:
+        raise RuntimeError("Server is shutting down")
+    future = asyncio.get_running_loop().create_future()
+    app.state.write_queue.put_nowait((item, future))
+    return future
+
+async def queue_insert(game: Match):
+    await queue_write(game)
+
+async def close_writes():
+    # The sentinel lands behind everything already queued, so the writer
+    # flushes all of it and then exits
+    write_queue = app.state.write_queue
+    app.state.writes_closed = True
+    write_queue.put_nowait(None)
+    try:
+        await app.state.write_task
+    except Exception as e:
+        log.error("Write task failed: %s", e)
+    while not write_queue.empty():
+        pending = write_queue.get_nowait()
+        if pending is not None and not pending[1].done():
+            pending[1].set_exception(RuntimeError("Server is shutting down"))
+
+async def write_matches(write_queue: asyncio.Queue):
+    stopping = False
+    while not stopping:
+        batch = [await write_queue.get()]
+        while len(batch) < WRITE_BATCH_SIZE and not write_queue.empty():
+            batch.append(write_queue.get_nowait())
+        if None in batch:
+            stopping = True
+            batch = [pending for pending in batch if pending is not None]
+            if not batch:
+                break
+        games = [(item, future) for item, future in batch if isinstance(item, Match)]
+        updates = [(item, future) for item, future in batch if not isinstance(item, Match)]
+        outcomes = []
+        try:
+            async with get_session() as session:
+                if games:
+                    rows = [game.model_dump() for game, _ in games]
+                    outcome = await execute_isolated(session, insert(Match), rows)
+                    if isinstance(outcome, Exception) and len(games) > 1:
+                        # Retry row by row so only the offending game fails
+                        for game, future in games:
+                            outcome = await execute_isolated(session, insert(Match), [game.model_dump()])
+                            outcomes.append((future, outcome if isinstance(outcome, Exception) else None))
+                    else:
+                        outcome = outcome if isinstance(outcome, Exception) else None
+                        outcomes.extend((future, outcome) for _, future in games)
+                for statement, future in updates:
+                    outcome = await execute_isolated(session, statement)
+                    outcomes.append((future, outcome if isinstance(outcome, Exception) else outcome.rowcount))
+        except Exception as e:
+            # The commit itself failed, so nothing in the batch was written
+            outcomes = [(future, e) for _, future in batch]
+        for future, outcome in outcomes:
+            if future.done():
+                continue
+            if isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+async def execute_isolated(session: AsyncSession, statement, params=None):
+    # Returns the result, or the exception if the savepoint was rolled back
+    try:
+        async with session.begin_nested():
+            result = await session.exec(statement, params=params)
+    except Exception as e:
+        log.error("Write failed: %s", e)
+        return e
+    return result
+
 # ——— WebSocket Management ———————————
+SEND_QUEUE_SIZE = 64
+
+class Connection:
+    __slots__ = ("websocket", "queue", "writer", "closed", "last")
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.writer: Optional[asyncio.Task] = None
+        self.closed = False
+        self.last: Optional[dict] = None  # last event queued, to skip repeats
+
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, Set[WebSocket]] = {}
+        # Each socket gets a bounded outbox drained by its own writer task, so a
+        # slow client never holds up the rest of the game. Per-game lists are
+        # scanned sequentially; closed entries are tombstoned and swept lazily.
+        self.active_connections: Dict[str, List[Connection]] = {}
+        self.sockets: Dict[WebSocket, Connection] = {}
+        self.closing: set = set()  # close tasks for dropped clients, kept referenced
 
-    async def connect(self, game_id: str, websocket: WebSocket):
+    async def connect(self, game: Match, websocket: WebSocket):
+        game_id = game.id
         await websocket.accept()
-        if game_id not in self.active_connections:
-            self.active_connections[game_id] = set()
-        self.active_connections[game_id].add(websocket)
+        connection = Connection(websocket)
+        connection.writer = asyncio.create_task(self._writer(game_id, connection))
+        self.active_connections.setdefault(game_id, []).append(connection)
+        self.sockets[websocket] = connection
+        # Start every socket on the current snapshot rather than waiting for a change
+        self._push(game_id, connection, state_payload(game)[2])
 
     def disconnect(self, game_id: str, websocket: WebSocket):
-        if game_id in self.active_connections:
-            self.active_connections[game_id].discard(websocket)
-            if not self.active_connections[game_id]:
-                del self.active_connections[game_id]
-
-    async def broadcast(self, game_id: str, message: dict):
-        if game_id in self.active_connections:
-            for connection in self.active_connections[game_id].copy():
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    log.error(f"Broadcast error: {str(e)}")
-                    self.disconnect(game_id, connection)
+        connection = self.sockets.pop(websocket, None)
+        if connection is None:
+            return
+        connection.closed = True
+        if connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+        connections = self.active_connections.get(game_id)
+        if connections is not None and all(c.closed for c in connections):
+            del self.active_connections[game_id]
+
+    def broadcast(self, game: Match):
+        game_id = game.id
+        connections = self.active_connections.get(game_id)
+        if not connections:
+            return
+        # One ready-made ASGI event shared by every socket. Events are rebuilt
+        # only when the game changes, so identity means nothing new to send.
+        event = state_payload(game)[2]
+        sweep = False
+        for connection in connections:
+            if not connection.closed and connection.last is not event:
+                self._push(game_id, connection, event)
+            sweep = sweep or connection.closed
+        if sweep:
+            alive = [c for c in connections if not c.closed]
+            if alive:
+                self.active_connections[game_id] = alive
+            else:
+                self.active_connections.pop(game_id, None)
+
+    def send_state(self, game: Match, websocket: WebSocket):
+        connection = self.sockets.get(websocket)
+        if connection is not None:
+            self._push(game.id, connection, state_payload(game)[2])
+
+    def broadcast_soon(self, game: Match):
+        # Fire-and-forget: the caller's response never waits on the fan-out
+        if game.id in self.active_connections:
+            asyncio.get_running_loop().call_soon(self.broadcast, game)
+
+    def _push(self, game_id: str, connection: Connection, event: dict):
+        connection.last = event
+        try:
+            connection.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            log.error("Send queue full in game %s, dropping slow client.", game_id)
+            self._drop(game_id, connection)
+
+    def _drop(self, game_id: str, connection: Connection):
+        # Unregistering alone would leave the client connected but deaf; closing
+        # the socket tells it to reconnect and ends the endpoint's receive loop
+        self.disconnect(game_id, connection.websocket)
+        task = asyncio.get_running_loop().create_task(self._close(connection.websocket))
+        self.closing.add(task)
+        task.add_done_callback(self.closing.discard)
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass  # already gone
+
+    async def _writer(self, game_id: str, connection: Connection):
+        queue = connection.queue
+        try:
+            while True:
+                event = await queue.get()
+                # Every frame is a full snapshot, so skip anything already superseded
+                while not queue.empty():
+                    event = queue.get_nowait()
+                await connection.websocket.send(event)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.error("Broadcast error: %s", e)
+            self._drop(game_id, connection)
 
 manager = ConnectionManager()
 
 # ——— API Endpoints ——————————————————
-class CreateGameRequest(BaseModel):
-    player_name: str
-
 @app.post("/create_game")
-def create_game(request: CreateGameRequest):
+async def create_game(player_name: str = Body(..., embed=True)):
     try:
-        with get_session() as session:
-            game = Match(p1_name=request.player_name)
-            session.add(game)
-            return {
-                "game_id": game.id,
-                "player_id": game.p1_id,
-                "role": "A"
-            }
+        game = Match(p1_name=player_name)
+        await queue_insert(game)
+        match_cache[game.id] = game
+        match_seen[game.id] = time.monotonic()
+        return {
+            "game_id": game.id,
+            "player_id": game.p1_id,
+            "role": "A"
+        }
+    except HTTPException:
+        raise
     except Exception as e:
-        log.error(f"Error creating game: {str(e)}")
+        log.error("Error creating game: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error while creating game")
 
-class JoinGameRequest(BaseModel):
-    player_name: str
-
 @app.post("/join/{game_id}")
-def join_game(game_id: str, request: JoinGameRequest):
+async def join_game(game_id: str, player_name: str = Body(..., embed=True)):
     try:
-        with get_session() as session:
-            game = session.get(Match, game_id)
+        async with match_lock(game_id):
+            game = await get_match(game_id)
             if not game:
-                log.error(f"Game {game_id} not found.")
+                log.error("Game %s not found.", game_id)
                 raise HTTPException(404, "Game not found")
             
-            if game.p2_id:
-                log.error(f"Game {game_id} is already full.")
+            joined = not game.p2_id and await update_match(
+                game, Match.p2_id.is_(None), p2_id=fast_uuid_str(), p2_name=player_name
+            )
+            if not joined:
+                log.error("Game %s is already full.", game_id)
                 raise HTTPException(400, "Game is full")
-            
-            game.p2_id = str(uuid.uuid4())
-            game.p2_name = request.player_name
-            session.add(game)
-            return {
-                "game_id": game.id,
-                "player_id": game.p2_id,
-                "role": "B"
-            }
+        manager.broadcast_soon(game)
+        return {
+            "game_id": game.id,
+            "player_id": game.p2_id,
+            "role": "B"
+        }
+    except HTTPException:
+        raise
     except Exception as e:
-        log.error(f"Error joining game {game_id}: {str(e)}")
+        log.error("Error joining game %s: %s", game_id, e)
         raise HTTPException(status_code=500, detail="Internal server error while joining game")
 
 @app.post("/ready/{game_id}")
-def set_ready(game_id: str, player_id: str = Body(..., embed=True)):
+async def set_ready(game_id: str, player_id: str = Body(..., embed=True)):
     try:
-        with get_session() as session:
-            game = session.get(Match, game_id)
+        async with match_lock(game_id):
+            game = await get_match(game_id)
             if not game:
-                log.error(f"Game {game_id} not found.")
+                log.error("Game %s not found.", game_id)
                 raise HTTPException(404, "Game not found")
             
             if player_id == game.p1_id:
-                game.p1_ready = True
+                await update_match(game, p1_ready=True)
             elif player_id == game.p2_id:
-                game.p2_ready = True
+                await update_match(game, p2_ready=True)
             else:
-                log.error(f"Invalid player {player_id} for game {game_id}.")
+                log.error("Invalid player %s for game %s.", player_id, game_id)
                 raise HTTPException(403, "Invalid player")
-            
-            session.add(game)
-            return game_state(game)
+        manager.broadcast_soon(game)
+        return Response(state_payload(game)[0], media_type="application/json")
+    except HTTPException:
+        raise
     except Exception as e:
-        log.error(f"Error marking player as ready in game {game_id}: {str(e)}")
+        log.error("Error marking player as ready in game %s: %s", game_id, e)
         raise HTTPException(status_code=500, detail="Internal server error while marking ready")
 
 @app.post("/move/{game_id}")
-def submit_move(game_id: str, player_id: str = Body(..., embed=True), move: str = Body(..., embed=True)):
+async def submit_move(game_id: str, player_id: str = Body(..., embed=True), move: str = Body(..., embed=True)):
     try:
-        with get_session() as session:
-            game = session.get(Match, game_id)
+        async with match_lock(game_id):
+            game = await get_match(game_id)
             if not game:
-                log.error(f"Game {game_id} not found.")
+                log.error("Game %s not found.", game_id)
                 raise HTTPException(404, "Game not found")
             
             if player_id == game.p1_id:
-                game.p1_move = move
+                await update_match(game, p1_move=move)
             elif player_id == game.p2_id:
-                game.p2_move = move
+                await update_match(game, p2_move=move)
             else:
-                log.error(f"Invalid player {player_id} for game {game_id}.")
+                log.error("Invalid player %s for game %s.", player_id, game_id)
                 raise HTTPException(403, "Invalid player")
-            
-            session.add(game)
-            return game_state(game)
+        manager.broadcast_soon(game)
+        return Response(state_payload(game)[0], media_type="application/json")
+    except HTTPException:
+        raise
     except Exception as e:
-        log.error(f"Error submitting move for game {game_id}: {str(e)}")
+        log.error("Error submitting move for game %s: %s", game_id, e)
         raise HTTPException(status_code=500, detail="Internal server error while submitting move")
 
 @app.get("/state/{game_id}")
-def get_game_state(game_id: str):
+async def get_game_state(game_id: str, if_none_match: Optional[str] = Header(None)):
     try:
-        with get_session() as session:
-            game = session.get(Match, game_id)
-            if not game:
-                log.error(f"Game {game_id} not found.")
-                raise HTTPException(404, "Game not found")
-            
-            return {
-                "players": {
-                    "A": {"id": game.p1_id, "name": game.p1_name, "ready": game.p1_ready},
-                    "B": {"id": game.p2_id, "name": game.p2_name, "ready": game.p2_ready} if game.p2_id else None,
-                },
-                "moves": {"A": game.p1_move, "B": game.p2_move},
-                "is_active": game.is_active
-            }
+        game = await get_match(game_id)
+        if not game:
+            log.error("Game %s not found.", game_id)
+            raise HTTPException(404, "Game not found")
+        
+        # Pollers that already hold the current state get an empty 304
+        body, etag, _ = state_payload(game)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if if_none_match == etag:
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type="application/json", headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
-        log.error(f"Error getting state for game {game_id}: {str(e)}")
+        log.error("Error getting state for game %s: %s", game_id, e)
         raise HTTPException(status_code=500, detail="Internal server error while getting game state")
 
 # ——— WebSocket Endpoint ——————————————
 @app.websocket("/ws/{game_id}/{player_id}")
 async def websocket_endpoint(websocket: WebSocket, game_id: str, player_id: str):
     try:
-        with get_session() as session:
-            game = session.get(Match, game_id)
-            if not game or not game.is_active:
-                log.error(f"Game {game_id} not found or is inactive.")
-                await websocket.close(code=1008)
-                return
-
-            if player_id not in [game.p1_id, game.p2_id]:
-                log.error(f"Player {player_id} is not part of game {game_id}.")
-                await websocket.close(code=1008)
-                return
-
-        await manager.connect(game_id, websocket)
+        game = await get_match(game_id)
+        if not game or not game.is_active:
+            log.error("Game %s not found or is inactive.", game_id)
+            await websocket.close(code=1008)
+            return
+
+        if player_id != game.p1_id and player_id != game.p2_id:
+            log.error("Player %s is not part of game %s.", player_id, game_id)
+            await websocket.close(code=1008)
+            return
+
+        await manager.connect(game, websocket)
         
-        try:
-            while True:
-                await websocket.receive_text()
-                state = get_game_state(game_id)
-                await manager.broadcast(game_id, state)
-                
-        except WebSocketDisconnect:
-            manager.disconnect(game_id, websocket)
-            log.info(f"Player {player_id} disconnected from game {game_id}")
+        # Nothing changed, so only the asking socket needs the snapshot
+        async for _ in websocket.iter_text():
+            game = await get_match(game_id)
+            manager.send_state(game, websocket)
+        log.info("Player %s disconnected from game %s", player_id, game_id)
             
     except Exception as e:
-        log.error(f"WebSocket error: {str(e)}")
-        await websocket.close(code=1008)
+        log.error("WebSocket error: %s", e)
+        if (websocket.client_state != WebSocketState.DISCONNECTED
+                and websocket.application_state != WebSocketState.DISCONNECTED):
+            await websocket.close(code=1008)
     finally:
         manager.disconnect(game_id, websocket)
 
@@ -246,3 +581,10 @@ def game_state(game: Match) -> dict:
         "moves": {"A": game.p1_move, "B": game.p2_move},
         "is_active": game.is_active
     }
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(
+        app, host="0.0.0.0", port=int(os.getenv("PORT", "8000")),
+        loop="uvloop", http="httptools", ws="websockets", backlog=2048,
+    )